@@ -1,66 +1,325 @@
 import os
+import asyncio
+import logging
+import time
+import hashlib
+from collections import OrderedDict
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 import chromadb
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from backend.retry import openai_retry
+from backend.embeddings import get_cached_embeddings, store_embeddings, normalize, dimensions_param, embed_dimensions
+from backend.vector_store import configure_hnsw_params
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv('config.env')
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI client (retries are handled by openai_retry). It shares one HTTP/2 client
+# with keep-alive across all of its calls, so TLS setup is paid once per process.
+aclient = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        timeout=30.0
+    )
+)
+
+# Caps OpenAI requests in flight across all concurrent /ask calls, to stay under the RPM limit
+openai_semaphore = asyncio.Semaphore(32)
+
+EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 
 # Initialize ChromaDB with persistent storage
 chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(name="films")
+collection = chroma_client.get_or_create_collection(
+    name=os.getenv("CHROMA_COLLECTION_NAME", "films"),
+    metadata=configure_hnsw_params(),
+    # Queries always pass embed_query's vectors, so Chroma never needs to embed text itself
+    embedding_function=None
+)
 
-async def ask(query: str):
+_collection_ready = False
+
+# Number of films retrieved per question, from each of the vector and keyword searches
+N_RESULTS = 5
+# Keyword hits fetched before dropping films that were never ingested into the collection
+KEYWORD_CANDIDATES = 4 * N_RESULTS
+# Rank offset for reciprocal rank fusion; 60 is the usual choice and damps the top ranks' weight
+RRF_K = 60
+
+# Keyword search over the film table, fused with the vector results. Disabled without a DATABASE_URL.
+# It uses dvdrental's own film.fulltext tsvector (title and description, kept current by a trigger
+# and indexed). The question's words are ORed, since questions are full of words like "year" or
+# "rating" that never appear in a title or description, and ts_rank orders films by how many match.
+DATABASE_URL = os.getenv("DATABASE_URL")
+db_engine = create_engine(DATABASE_URL, pool_size=10, pool_pre_ping=True, pool_recycle=1800) if DATABASE_URL else None
+KEYWORD_SEARCH_SQL = text("""
+    SELECT film_id
+    FROM film, to_tsquery('english', replace(plainto_tsquery('english', :q)::text, ' & ', ' | ')) AS query
+    WHERE fulltext @@ query
+    ORDER BY ts_rank(fulltext, query) DESC
+    LIMIT :limit
+""")
+
+# Bounds on retrieved context, to keep the chat prompt (and its latency) small
+MAX_DOCUMENT_CHARS = 800
+MAX_CONTEXT_CHARS = 3000
+
+# Semantic cache of previously answered questions, keyed by query embedding. One per films
+# collection and embedding size, so answers don't leak across collections and the query
+# vectors always match the cache's dimension.
+_query_cache_name = f"{collection.name}_query_cache"
+if embed_dimensions():
+    _query_cache_name += f"_d{embed_dimensions()}"
+query_cache = chroma_client.get_or_create_collection(
+    name=_query_cache_name,
+    metadata={"hnsw:space": "cosine"},
+    embedding_function=None
+)
+# Cosine distance under which a cached question counts as the same question
+CACHE_DISTANCE_THRESHOLD = 0.05
+# Cached answers older than this are ignored and evicted
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# In-process LRU of responses by exact (whitespace/case-normalized) question text, checked before
+# anything else so hot questions skip even the embedding lookup
+EXACT_CACHE_SIZE = 1024
+_exact_cache = OrderedDict()
+
+# Opt-in speculative generation: when set, ask() starts an answer without context while retrieval
+# runs, and serves it when the closest document is at least this cosine distance away (retrieval
+# adds little). Otherwise it is cancelled. Costs an extra chat call per semantic-cache miss, and
+# speculative answers are never cached.
+SPECULATIVE_DISTANCE_THRESHOLD = float(os.environ["SPECULATIVE_DISTANCE_THRESHOLD"]) if os.getenv("SPECULATIVE_DISTANCE_THRESHOLD") else None
+
+@openai_retry
+async def create_embedding(text: str):
+    async with openai_semaphore:
+        response = await aclient.embeddings.create(
+            input=text,
+            model=EMBED_MODEL,
+            dimensions=dimensions_param()
+        )
+    return normalize(response.data[0].embedding)
+
+async def embed_query(query: str):
+    """Embed a query through the same SQLite cache that ingestion uses"""
+    # SQLite reads and commits block, so they run in worker threads like the Chroma calls
+    cached = (await asyncio.to_thread(get_cached_embeddings, [query], EMBED_MODEL))[0]
+    if cached is not None:
+        return cached
+    embedding = await create_embedding(query)
+    await asyncio.to_thread(store_embeddings, [query], [embedding], EMBED_MODEL)
+    return embedding
+
+@openai_retry
+async def create_chat_completion(prompt: str, stream: bool = False):
+    async with openai_semaphore:
+        return await aclient.chat.completions.create(
+            model=OPENAI_CHAT_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,  # Controls randomness (0-2, lower is more focused)
+            stream=stream
+        )
+
+def get_cached_answer(query_embedding):
+    """Return the cached response for a near-identical earlier question, or None"""
+    results = query_cache.query(
+        query_embeddings=[query_embedding],
+        n_results=1,
+        include=["metadatas", "distances"]
+    )
+    if not results["ids"] or not results["ids"][0]:
+        return None
+
+    distance = results["distances"][0][0]
+    metadata = results["metadatas"][0][0]
+    if distance >= CACHE_DISTANCE_THRESHOLD:
+        return None
+    if time.time() - metadata["ts"] > CACHE_TTL_SECONDS:
+        query_cache.delete(ids=[results["ids"][0][0]])
+        return None
+
+    logger.info("♻️  Semantic cache hit (distance: %.4f)", distance)
+    return {
+        "answer": metadata["answer"],
+        "context": metadata["context"]
+    }
+
+def _exact_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def get_exact_cached_answer(query: str):
+    """Return the response for an exact repeat of an earlier question, or None"""
+    key = _exact_key(query)
+    entry = _exact_cache.get(key)
+    if entry is None:
+        return None
+    response, ts = entry
+    if time.time() - ts > CACHE_TTL_SECONDS:
+        del _exact_cache[key]
+        return None
+    _exact_cache.move_to_end(key)
+    logger.info("♻️  Exact cache hit")
+    return response
+
+def remember_answer(query: str, response: dict):
+    key = _exact_key(query)
+    _exact_cache[key] = (response, time.time())
+    _exact_cache.move_to_end(key)
+    if len(_exact_cache) > EXACT_CACHE_SIZE:
+        _exact_cache.popitem(last=False)
+
+def cache_answer(query: str, query_embedding, answer: str, context: str):
+    # Keyed by the normalized question, so asking the same question again overwrites its entry
+    query_cache.upsert(
+        ids=[hashlib.sha256(_exact_key(query).encode()).hexdigest()],
+        documents=[query],
+        embeddings=[query_embedding],
+        metadatas=[{"answer": answer, "context": context, "ts": time.time()}]
+    )
+
+def vector_search(query_embedding):
+    """Return the ids, documents and distances of the films nearest to the query embedding"""
+    # Metadatas aren't used, so they aren't fetched back
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=N_RESULTS,
+        include=["documents", "distances"]
+    )
+    if not results["ids"] or not results["ids"][0]:
+        return [], [], []
+    return results["ids"][0], results["documents"][0], results["distances"][0]
+
+def keyword_search(query: str):
+    """Return the ids and documents of collection films whose title or description match the
+    query's words, best first
+    """
+    if db_engine is None:
+        return [], []
     try:
-        print(f"🔍 Processing query: '{query}'")
-        
-        # Check if collection has data
+        with db_engine.connect() as conn:
+            rows = conn.execute(KEYWORD_SEARCH_SQL, {"q": query, "limit": KEYWORD_CANDIDATES}).fetchall()
+    except SQLAlchemyError:
+        # Vector results alone are still a usable answer
+        logger.warning("⚠️  Keyword search failed, using vector results only", exc_info=True)
+        return [], []
+    if not rows:
+        return [], []
+    # Chroma ids are the film_ids as strings (see ingest.py). The film table can hold films that
+    # were never ingested, so keep only the hits the collection has a document for.
+    candidate_ids = [str(row.film_id) for row in rows]
+    results = collection.get(ids=candidate_ids, include=["documents"])
+    found = dict(zip(results["ids"], results["documents"]))
+    ids = [doc_id for doc_id in candidate_ids if doc_id in found][:N_RESULTS]
+    return ids, [found[doc_id] for doc_id in ids]
+
+def reciprocal_rank_fusion(*rankings, limit: int):
+    """Merge ranked id lists, scoring each id by the sum of 1 / (RRF_K + rank) over the lists"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+def collection_ready() -> bool:
+    """Check once that the films collection has documents, instead of calling count() per request"""
+    global _collection_ready
+    if not _collection_ready:
+        # Keep re-checking while empty so ingestion can run after the API has started
         collection_count = collection.count()
-        print(f"📊 Collection contains {collection_count} documents")
-        
-        if collection_count == 0:
-            return {
-                "answer": "Error: No documents found in the collection. Please run the data ingestion script first.",
-                "context": ""
-            }
-        
-        # Get embedding for the query
-        print("🤖 Getting query embedding...")
-        response = client.embeddings.create(
-            input=query,
-            model="text-embedding-3-small"
-        )
-        query_embedding = response.data[0].embedding
-        print(f"✅ Query embedding created (length: {len(query_embedding)})")
-        
-        # Query ChromaDB
-        print("🔎 Querying ChromaDB...")
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=5
+        logger.info("📊 Collection contains %d documents", collection_count)
+        _collection_ready = collection_count > 0
+    return _collection_ready
+
+def warm_up():
+    """Query the films collection once so its HNSW index is loaded before the first request"""
+    if not collection_ready():
+        return
+    # A stored vector has the collection's dimension whatever embedding size it was built with
+    sample = collection.get(limit=1, include=["embeddings"])
+    collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1, include=[])
+    logger.info("🔥 Collection index warmed up")
+
+async def prepare(query: str, speculate: bool = False):
+    """Run every step before generation
+
+    Returns a dict with "answer" and "context" when the response is already known
+    (empty collection, cache hit, nothing retrieved), otherwise a dict with the
+    "query_embedding", "context", "prompt" and "top_distance" needed to generate the answer.
+    With speculate, an answer without context is started once the semantic cache misses, and
+    the task is returned as "speculative"; the caller must await or _discard it.
+    """
+    logger.info("🔍 Processing query: '%s'", query)
+    
+    # Check if collection has data
+    if not collection_ready():
+        return {
+            "answer": "Error: No documents found in the collection. Please run the data ingestion script first.",
+            "context": ""
+        }
+    
+    # Get embedding for the query
+    logger.debug("🤖 Getting query embedding...")
+    query_embedding = await embed_query(query)
+    logger.debug("✅ Query embedding created (length: %d)", len(query_embedding))
+    
+    # Serve repeated and paraphrased questions from the semantic cache, before paying for retrieval.
+    # Chroma is synchronous, so its calls run in worker threads to keep the event loop free.
+    cached = await asyncio.to_thread(get_cached_answer, query_embedding)
+    if cached:
+        remember_answer(query, cached)
+        return cached
+    
+    # Start answering from the model's own knowledge while retrieval is in flight
+    speculative = None
+    if speculate:
+        speculative = asyncio.create_task(create_chat_completion(_ungrounded_prompt(query)))
+    
+    # Query ChromaDB and run the keyword search at the same time
+    logger.debug("🔎 Querying ChromaDB and the film table...")
+    try:
+        (vector_ids, vector_documents, distances), (keyword_ids, keyword_documents) = await asyncio.gather(
+            asyncio.to_thread(vector_search, query_embedding),
+            asyncio.to_thread(keyword_search, query)
         )
-        
-        print(f"📋 ChromaDB results: {results}")
-        
-        # Extract documents
-        documents = results["documents"][0] if results["documents"] else []
-        print(f"📄 Found {len(documents)} relevant documents")
-        
-        if not documents:
-            return {
-                "answer": "I don't know the answer to that question. No relevant information found in the database.",
-                "context": ""
-            }
-        
-        context = "\n".join(documents)
-        print(f"📝 Context length: {len(context)} characters")
-        print(f"📝 Context preview: {context[:200]}...")
-        
-        # Create prompt
-        prompt = f"""You are a helpful film expert. Answer the question based on the context below. 
+    except BaseException:
+        if speculative:
+            _discard(speculative)
+        raise
+    
+    # Keyword hits catch exact titles and names that embeddings rank poorly
+    logger.debug("🔤 Keyword search matched %d films", len(keyword_ids))
+    fused_ids = reciprocal_rank_fusion(vector_ids, keyword_ids, limit=N_RESULTS)
+    documents_by_id = {**dict(zip(keyword_ids, keyword_documents)), **dict(zip(vector_ids, vector_documents))}
+    documents = [documents_by_id[doc_id] for doc_id in fused_ids]
+    # A keyword match on an ingested film means the collection holds a relevant document,
+    # whatever the vector distance
+    top_distance = 0.0 if keyword_ids else (distances[0] if distances else None)
+    
+    logger.debug("📄 Found %d relevant documents", len(documents))
+    
+    if not documents:
+        if speculative:
+            _discard(speculative)
+        return {
+            "answer": "I don't know the answer to that question. No relevant information found in the database.",
+            "context": ""
+        }
+    
+    context = "\n".join(d[:MAX_DOCUMENT_CHARS] for d in documents)[:MAX_CONTEXT_CHARS]
+    logger.debug("📝 Context length: %d characters", len(context))
+    
+    # Create prompt
+    prompt = f"""You are a helpful film expert. Answer the question based on the context below. 
 If the question cannot be answered based on the context, say 'I don't know the answer to that question based on the available information.'
 
 Context: {context}
@@ -68,27 +327,104 @@ Context: {context}
 Question: {query}
 
 Answer:"""
+    
+    logger.debug("📤 Sending prompt to OpenAI (length: %d characters)", len(prompt))
+    
+    return {
+        "query_embedding": query_embedding,
+        "context": context,
+        "prompt": prompt,
+        "top_distance": top_distance,
+        "speculative": speculative
+    }
+
+def _ungrounded_prompt(query: str) -> str:
+    return f"""You are a helpful film expert. Answer the question below.
+
+Question: {query}
+
+Answer:"""
+
+def _discard(task: asyncio.Task):
+    """Cancel a speculative call that is no longer needed"""
+    task.cancel()
+    # Retrieve any exception it already finished with, so asyncio doesn't log it as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def ask(query: str):
+    """Answer a question; errors propagate so the API can return a proper status code"""
+    cached = get_exact_cached_answer(query)
+    if cached:
+        return cached
+    
+    prepared = await prepare(query, speculate=SPECULATIVE_DISTANCE_THRESHOLD is not None)
+    if "answer" in prepared:
+        return prepared
+    
+    speculative = prepared["speculative"]
+    response = None
+    if speculative and prepared["top_distance"] >= SPECULATIVE_DISTANCE_THRESHOLD:
+        # No document is close enough to matter, so the speculative answer stands
+        logger.info("⚡ Using speculative answer (top distance: %.4f)", prepared["top_distance"])
+        try:
+            response = await speculative
+            context = ""
+        except Exception:
+            # Retrieval succeeded, so a grounded answer is still possible
+            logger.warning("⚠️  Speculative answer failed, generating a grounded one", exc_info=True)
+    elif speculative:
+        _discard(speculative)
+    
+    grounded = response is None
+    if grounded:
+        # Get response from OpenAI
+        response = await create_chat_completion(prepared["prompt"])
+        context = prepared["context"]
+    
+    answer = response.choices[0].message.content
+    logger.debug("✅ OpenAI response: %s", answer)
+    
+    response = {
+        "answer": answer,
+        "context": context
+    }
+    # Speculative answers aren't based on the database, so they're never cached: serving one
+    # to a later paraphrase would present it as a grounded answer
+    if grounded:
+        remember_answer(query, response)
+        await asyncio.to_thread(cache_answer, query, prepared["query_embedding"], answer, context)
+    
+    return response
+
+async def ask_stream(query: str):
+    """Like ask, but yields the answer text as the model generates it"""
+    try:
+        cached = get_exact_cached_answer(query)
+        if cached:
+            yield cached["answer"]
+            return
         
-        print(f"📤 Sending prompt to OpenAI (length: {len(prompt)} characters)")
+        prepared = await prepare(query)
+        if "answer" in prepared:
+            yield prepared["answer"]
+            return
         
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7  # Controls randomness (0-2, lower is more focused)
-        )
+        # Stream the response from OpenAI, forwarding each token as it arrives
+        parts = []
+        async for chunk in await create_chat_completion(prepared["prompt"], stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
         
-        answer = response.choices[0].message.content
-        print(f"✅ OpenAI response: {answer}")
+        answer = "".join(parts)
+        logger.debug("✅ OpenAI streamed response: %s", answer)
         
-        return {
-            "answer": answer,
-            "context": context
-        }
+        remember_answer(query, {"answer": answer, "context": prepared["context"]})
+        await asyncio.to_thread(cache_answer, query, prepared["query_embedding"], answer, prepared["context"])
         
-    except Exception as e:
-        print(f"❌ Error in ask function: {str(e)}")
-        return {
-            "answer": f"Error: {str(e)}",
-            "context": ""
-        }
\ No newline at end of file
+    except Exception:
+        # The 200 status is already sent once streaming starts, so report the failure in-band
+        # without exposing exception details
+        logger.exception("❌ Error in ask_stream function")
+        yield "Error: the answer could not be generated."
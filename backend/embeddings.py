@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from openai import NOT_GIVEN
+
+# Exact-match cache of embeddings, keyed by SHA-256 of model + text.
+# Vectors are stored as float16, halving the cache size with negligible recall loss.
+DEFAULT_EMBEDDINGS_CACHE_PATH = "embeddings_cache.sqlite"
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def _get_db():
+    global _db
+    if _db is None:
+        # EMBEDDINGS_CACHE_PATH is read on first use, since callers load config.env after import
+        path = os.getenv("EMBEDDINGS_CACHE_PATH", DEFAULT_EMBEDDINGS_CACHE_PATH)
+        _db = sqlite3.connect(path, check_same_thread=False)
+        _db.execute("CREATE TABLE IF NOT EXISTS emb_f16 (hash TEXT PRIMARY KEY, model TEXT, vec BLOB)")
+    return _db
+
+
+def normalize(embedding):
+    """Scale an embedding to unit length so cosine similarity reduces to a dot product"""
+    v = np.asarray(embedding, dtype=np.float32)
+    v /= np.linalg.norm(v) + 1e-12
+    return v.tolist()
+
+
+def to_float16(embedding):
+    """Round an embedding to float16 precision, returned as float32 values for Chroma"""
+    return np.asarray(embedding, dtype=np.float16).astype(np.float32).tolist()
+
+
+def embed_dimensions():
+    """Optional Matryoshka truncation (text-embedding-3 models only), e.g. 512 instead of 1536
+
+    Read from OPENAI_EMBED_DIMENSIONS on each call, since callers load config.env after import.
+    None keeps the model's native size.
+    """
+    value = os.getenv("OPENAI_EMBED_DIMENSIONS")
+    return int(value) if value else None
+
+
+def dimensions_param():
+    """Value for the embeddings API's dimensions argument"""
+    return embed_dimensions() or NOT_GIVEN
+
+
+def _hash(text: str, model: str) -> str:
+    # Truncated vectors are cached separately from full-size ones
+    dimensions = embed_dimensions()
+    if dimensions:
+        model = f"{model}/{dimensions}"
+    return hashlib.sha256(f"{model}|{text}".encode()).hexdigest()
+
+
+def get_cached_embeddings(texts, model):
+    """Return a list aligned with texts holding the cached embedding or None for each"""
+    hashes = [_hash(t, model) for t in texts]
+    with _db_lock:
+        db = _get_db()
+        found = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = db.execute(f"SELECT hash, vec FROM emb_f16 WHERE hash IN ({placeholders})", chunk).fetchall()
+            found.update(rows)
+    return [
+        np.frombuffer(found[h], dtype=np.float16).astype(np.float32).tolist() if h in found else None
+        for h in hashes
+    ]
+
+
+def store_embeddings(texts, embeddings, model):
+    rows = [
+        (_hash(t, model), model, np.asarray(e, dtype=np.float16).tobytes())
+        for t, e in zip(texts, embeddings)
+    ]
+    with _db_lock:
+        db = _get_db()
+        db.executemany("INSERT OR REPLACE INTO emb_f16 (hash, model, vec) VALUES (?, ?, ?)", rows)
+        db.commit()
@@ -0,0 +1,42 @@
+import logging
+import openai
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+logger = logging.getLogger(__name__)
+
+# Transient OpenAI failures worth retrying: rate limits, 5xx responses and network errors
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # also covers APITimeoutError
+)
+
+_backoff = wait_exponential(multiplier=1, max=30)
+
+
+def _wait_retry_after(retry_state):
+    """Honour the Retry-After header when OpenAI sends one, otherwise back off exponentially"""
+    exc = retry_state.outcome.exception()
+    response = getattr(exc, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            return min(float(retry_after), 30)
+        except (TypeError, ValueError):
+            pass
+    return _backoff(retry_state)
+
+
+def _log_retry(retry_state):
+    exc = retry_state.outcome.exception()
+    logger.warning("⚠️  OpenAI call failed (%s), retry attempt %d...", type(exc).__name__, retry_state.attempt_number)
+
+
+# Works for both sync and async functions
+openai_retry = retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=_wait_retry_after,
+    stop=stop_after_attempt(6),
+    before_sleep=_log_retry,
+    reraise=True,
+)
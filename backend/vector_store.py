@@ -0,0 +1,21 @@
+def configure_hnsw_params(vector_count: int = 0) -> dict:
+    """Collection metadata with HNSW parameters sized for the expected number of vectors
+
+    Chroma only applies these when the collection is created, so an existing
+    ./chroma_db has to be removed and re-ingested for changes to take effect.
+    """
+    if vector_count < 10_000:
+        # Small graphs (the films table is ~1000 rows) reach near-exact recall with far less work
+        m, construction_ef, search_ef = 16, 100, 32
+    elif vector_count < 100_000:
+        m, construction_ef, search_ef = 16, 128, 100
+    elif vector_count < 1_000_000:
+        m, construction_ef, search_ef = 24, 128, 100
+    else:
+        m, construction_ef, search_ef = 32, 128, 100
+    return {
+        "hnsw:space": "cosine",
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+    }
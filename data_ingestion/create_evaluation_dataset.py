@@ -1,43 +1,44 @@
 import os
 import json
 import random
+import logging
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv('config.env')
 
 # Setup database connection
 DATABASE_URL = os.getenv("DATABASE_URL")
+engine = create_engine(DATABASE_URL, pool_size=5, pool_pre_ping=True, pool_recycle=1800)
 
 def create_evaluation_dataset():
     """Create evaluation dataset with questions and expected answers from film table"""
     
-    print("🔌 Connecting to database...")
-    engine = create_engine(DATABASE_URL)
-    conn = engine.connect()
-    
-    # Fetch 20 random films from the database
-    print("📊 Fetching random film data...")
-    result = conn.execute(text("""
-        SELECT film_id, title, description, release_year, rental_rate, rating 
-        FROM film 
-        ORDER BY RANDOM() 
-        LIMIT 20
-    """)).fetchall()
+    # Fetch 20 random films from the database; the connection goes back to the pool afterwards
+    logger.info("📊 Fetching random film data...")
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(text("""
+            SELECT film_id, title, description, release_year, rental_rate, rating 
+            FROM film 
+            ORDER BY RANDOM() 
+            LIMIT 20
+        """)).mappings().all()
     
-    print(f"✅ Fetched {len(result)} random films")
+    logger.info("✅ Fetched %d random films", len(result))
     
     evaluation_data = []
     
     # Create questions for each column
     for film in result:
-        film_id = film.film_id
-        title = film.title
-        description = film.description
-        release_year = film.release_year
-        rental_rate = film.rental_rate
-        rating = film.rating
+        film_id = film["film_id"]
+        title = film["title"]
+        description = film["description"]
+        release_year = film["release_year"]
+        rental_rate = film["rental_rate"]
+        rating = film["rating"]
         
         # Question 1: Film rating
         evaluation_data.append({
@@ -80,20 +81,19 @@ def create_evaluation_dataset():
     with open(output_file, 'w') as f:
         json.dump(evaluation_data, f, indent=2)
     
-    print(f"✅ Created evaluation dataset with {len(evaluation_data)} questions")
-    print(f"📁 Saved to: {output_file}")
+    logger.info("✅ Created evaluation dataset with %d questions", len(evaluation_data))
+    logger.info("📁 Saved to: %s", output_file)
     
-    # Print sample questions
-    print("\n📋 Sample questions:")
+    # Log sample questions
+    logger.info("")
+    logger.info("📋 Sample questions:")
     for i, item in enumerate(evaluation_data[:5]):
-        print(f"{i+1}. Q: {item['question']}")
-        print(f"   A: {item['expected_answer']}")
-        print()
-    
-    conn.close()
-    print("🔌 Database connection closed")
+        logger.info("%d. Q: %s", i + 1, item["question"])
+        logger.info("   A: %s", item["expected_answer"])
+        logger.info("")
     
     return evaluation_data
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
     create_evaluation_dataset() 
\ No newline at end of file
@@ -5,11 +5,25 @@
 ## It only runs once to create the initial collection.
 
 import os
+import io
+import csv
+import sys
+import logging
+import asyncio
+import httpx
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from openai import OpenAI
+from sqlalchemy import create_engine
+from openai import AsyncOpenAI
 import chromadb
 
+# Make the shared backend helpers importable when run as `python3 data_ingestion/ingest.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.retry import openai_retry
+from backend.embeddings import get_cached_embeddings, store_embeddings, normalize, to_float16, dimensions_param
+from backend.vector_store import configure_hnsw_params
+
+logger = logging.getLogger(__name__)
+
 # 1. Load environment variables
 load_dotenv('config.env')
 
@@ -18,75 +32,149 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 CHROMA_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME")
 OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL")
 
-print(f"🔧 Configuration:")
-print(f"   Database URL: {DATABASE_URL}")
-print(f"   Collection Name: {CHROMA_COLLECTION_NAME}")
-print(f"   Embed Model: {OPENAI_EMBED_MODEL}")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# 3. Connect to database
-print("🔌 Connecting to database...")
-engine = create_engine(DATABASE_URL)
-conn = engine.connect()
-
-# 4. Fetch data from the film table (limited to first 100 films)
-print("📊 Fetching film data...")
-result = conn.execute(text("SELECT film_id, title, description, release_year, rental_rate, rating FROM film  ORDER BY film_id LIMIT 100")).fetchall()
-print(f"✅ Fetched {len(result)} films from database")
-
-# 5. Connect to ChromaDB with persistent storage
-print("🔗 Connecting to ChromaDB...")
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-print(f"✅ ChromaDB client initialized with persistent storage")
-
-# Check existing collections
-existing_collections = chroma_client.list_collections()
-print(f"📋 Existing collections: {[col.name for col in existing_collections]}")
-
-# Get or create collection
-collection = chroma_client.get_or_create_collection(CHROMA_COLLECTION_NAME)
-print(f"✅ Collection '{CHROMA_COLLECTION_NAME}' ready")
-
-# Check if collection already has data
-existing_count = collection.count()
-print(f"📊 Collection currently contains {existing_count} documents")
-
-if existing_count > 0:
-    print("⚠️  Collection already has data. Skipping ingestion.")
-else:
-    print("🔄 Starting data ingestion...")
-    
-    # 6. Process and insert into Chroma
-    for i, row in enumerate(result):
-        film_id = str(row.film_id)
-        text_to_embed = f"Title: {row.title} | Description: {row.description or ''} | Release Year: {row.release_year or 'N/A'} | Rental Rate: ${row.rental_rate or 'N/A'} | Rating: {row.rating or 'N/A'}"
-        
-        print(f"📝 Processing film {i+1}/{len(result)}: {row.title}")
-
-        # Get embedding from OpenAI using current API
-        response = client.embeddings.create(
-            input=text_to_embed,
-            model=OPENAI_EMBED_MODEL
+# Number of texts sent per embeddings request (keeps each request under OpenAI's per-request token cap)
+EMBED_BATCH_SIZE = 96
+# Maximum number of embeddings requests in flight at once (keeps us under OpenAI's RPM limit)
+EMBED_CONCURRENCY = 10
+
+engine = create_engine(DATABASE_URL, pool_size=5, pool_pre_ping=True, pool_recycle=1800)
+
+# Initialize OpenAI client (retries are handled by openai_retry). Concurrent batches are
+# multiplexed over shared HTTP/2 keep-alive connections.
+aclient = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=EMBED_CONCURRENCY, max_keepalive_connections=EMBED_CONCURRENCY),
+        timeout=30.0
+    )
+)
+
+
+def fetch_films():
+    """Export the films with COPY ... TO STDOUT as CSV
+
+    PostgreSQL streams the whole result in one COPY round trip, skipping cursor fetches and
+    per-row Row objects. Values come back as strings (NULL as ''), which format into the same
+    document text as the original column types, so cached embeddings still match.
+    """
+    buffer = io.StringIO()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.copy_expert(
+            "COPY (SELECT film_id, title, description, release_year, rental_rate, rating FROM film ORDER BY film_id LIMIT 100) "
+            "TO STDOUT WITH (FORMAT csv, HEADER)",
+            buffer
         )
-        embedding = response.data[0].embedding
-
-        # Store in Chroma
+        cursor.close()
+    finally:
+        # Returns the connection to the pool
+        raw.close()
+    buffer.seek(0)
+    return list(csv.DictReader(buffer))
+
+
+@openai_retry
+async def create_embeddings(chunk):
+    """Embed one sub-batch, retrying rate limits and transient server errors"""
+    response = await aclient.embeddings.create(
+        input=chunk,
+        model=OPENAI_EMBED_MODEL,
+        dimensions=dimensions_param()
+    )
+    return response.data
+
+
+async def embed_texts(texts):
+    """Embed texts in sub-batches, sending up to EMBED_CONCURRENCY requests concurrently"""
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    chunks = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+
+    async def embed(chunk):
+        async with sem:
+            data = await create_embeddings(chunk)
+            logger.info("✅ Embedded batch of %d films", len(chunk))
+            return data
+
+    # gather preserves input order, so the flattened embeddings line up with texts
+    results = await asyncio.gather(*[embed(chunk) for chunk in chunks])
+    return [normalize(d.embedding) for batch in results for d in batch]
+
+
+async def main():
+    logger.info("🔧 Configuration:")
+    logger.info("   Database URL: %s", DATABASE_URL)
+    logger.info("   Collection Name: %s", CHROMA_COLLECTION_NAME)
+    logger.info("   Embed Model: %s", OPENAI_EMBED_MODEL)
+
+    # 3-4. Fetch data from the film table (limited to first 100 films). The connection is
+    # returned to the pool as soon as the rows are read, rather than held during embedding.
+    logger.info("📊 Fetching film data...")
+    result = fetch_films()
+    logger.info("✅ Fetched %d films from database", len(result))
+
+    # 5. Connect to ChromaDB with persistent storage
+    logger.info("🔗 Connecting to ChromaDB...")
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    logger.info("✅ ChromaDB client initialized with persistent storage")
+
+    # Check existing collections
+    existing_collections = chroma_client.list_collections()
+    logger.debug("📋 Existing collections: %s", [col.name for col in existing_collections])
+
+    # Get or create collection
+    collection = chroma_client.get_or_create_collection(
+        CHROMA_COLLECTION_NAME,
+        metadata=configure_hnsw_params(len(result)),
+        # Documents are always added with our own cached, normalized embeddings
+        embedding_function=None
+    )
+    logger.info("✅ Collection '%s' ready", CHROMA_COLLECTION_NAME)
+
+    # Check if collection already has data
+    existing_count = collection.count()
+    logger.info("📊 Collection currently contains %d documents", existing_count)
+
+    if existing_count > 0:
+        logger.warning("⚠️  Collection already has data. Skipping ingestion.")
+    else:
+        logger.info("🔄 Starting data ingestion...")
+
+        # 6. Build documents up front so they can be embedded in batches
+        texts = [
+            f"Title: {row['title']} | Description: {row['description'] or ''} | Release Year: {row['release_year'] or 'N/A'} | Rental Rate: ${row['rental_rate'] or 'N/A'} | Rating: {row['rating'] or 'N/A'}"
+            for row in result
+        ]
+        ids = [str(row["film_id"]) for row in result]
+
+        # 7. Get embeddings, only sending texts missing from the local cache to OpenAI
+        embeddings = get_cached_embeddings(texts, OPENAI_EMBED_MODEL)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        logger.info("♻️  %d embeddings found in cache, %d to fetch", len(texts) - len(missing), len(missing))
+        if missing:
+            new_texts = [texts[i] for i in missing]
+            new_embeddings = await embed_texts(new_texts)
+            store_embeddings(new_texts, new_embeddings, OPENAI_EMBED_MODEL)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+
+        # 8. Store everything in Chroma with a single add. Vectors are rounded to float16 so
+        # freshly fetched and cached embeddings are stored identically.
         collection.add(
-            documents=[text_to_embed],
-            embeddings=[embedding],
-            ids=[film_id]
+            documents=texts,
+            embeddings=[to_float16(e) for e in embeddings],
+            ids=ids
         )
-        
-        if (i + 1) % 10 == 0:
-            print(f"✅ Processed {i+1} films...")
 
-    print(f"✅ Data ingestion complete. Added {len(result)} films to collection.")
+        logger.info("✅ Data ingestion complete. Added %d films to collection.", len(result))
+
+    # Final verification
+    final_count = collection.count()
+    logger.info("📊 Final collection count: %d documents", final_count)
 
-# Final verification
-final_count = collection.count()
-print(f"📊 Final collection count: {final_count} documents")
 
-conn.close()
-print("🔌 Database connection closed")
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+    asyncio.run(main())
@@ -1,65 +1,89 @@
+import os
 import json
-import requests
-import time
-from difflib import SequenceMatcher
+import logging
+import asyncio
+import httpx
+from rapidfuzz import fuzz
 import re
 from typing import List, Dict, Tuple
 
+logger = logging.getLogger(__name__)
+
 def load_evaluation_dataset(file_path: str = "evaluation_dataset.json") -> List[Dict]:
     """Load the evaluation dataset from JSON file"""
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def query_rag_system(question: str, base_url: str = "http://localhost:8000") -> str:
+# Patterns used by normalize_text, compiled once at import
+_WS = re.compile(r'\s+')
+_PUNCT = re.compile(r'[^\w\s]')
+
+# Maximum number of /ask requests in flight at once
+MAX_CONCURRENT_QUERIES = 8
+
+async def query_rag_system(client: httpx.AsyncClient, question: str, base_url: str = "http://localhost:8000") -> str:
     """Query the RAG system's /ask endpoint"""
     try:
-        response = requests.post(
+        response = await client.post(
             f"{base_url}/ask",
             json={"question": question},
-            timeout=30
+            timeout=30.0
         )
         response.raise_for_status()
         return response.json()["answer"]
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error querying RAG system: {e}")
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        # Transport errors, non-JSON bodies and responses without an answer all score as ERROR
+        # for this question instead of aborting the whole run
+        logger.error("❌ Error querying RAG system: %s", e)
         return "ERROR"
 
-def normalize_text(text: str) -> str:
+async def query_all(questions: List[str], base_url: str = "http://localhost:8000") -> List[str]:
+    """Query the RAG system for all questions concurrently, capped at MAX_CONCURRENT_QUERIES"""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+
+    async def bounded(client: httpx.AsyncClient, question: str) -> str:
+        async with sem:
+            return await query_rag_system(client, question, base_url)
+
+    # One client for the whole run, with a keep-alive pool sized to the concurrency cap,
+    # so every request reuses one of a handful of open connections
+    limits = httpx.Limits(
+        max_connections=MAX_CONCURRENT_QUERIES,
+        max_keepalive_connections=MAX_CONCURRENT_QUERIES
+    )
+    async with httpx.AsyncClient(limits=limits) as client:
+        return await asyncio.gather(*[bounded(client, q) for q in questions])
+
+def normalize_text(text: str) -> Tuple[str, str]:
     """Normalize text for comparison by removing extra whitespace and converting to lowercase"""
     if not text:
-        return ""
+        return "", ""
     # Remove extra whitespace and convert to lowercase
-    normalized = re.sub(r'\s+', ' ', text.strip()).lower()
+    normalized = _WS.sub(' ', text.strip()).lower()
     # Remove punctuation for some comparisons
-    normalized_no_punct = re.sub(r'[^\w\s]', '', normalized)
+    normalized_no_punct = _PUNCT.sub('', normalized)
     return normalized, normalized_no_punct
 
-def exact_match_score(expected: str, actual: str) -> bool:
+# The metric functions below take the (normalized, normalized_no_punct) pairs returned by
+# normalize_text, so each answer is normalized once rather than once per metric
+
+def exact_match_score(expected: Tuple[str, str], actual: Tuple[str, str]) -> bool:
     """Check if expected and actual answers match exactly (case-insensitive)"""
-    expected_norm, _ = normalize_text(expected)
-    actual_norm, _ = normalize_text(actual)
-    return expected_norm == actual_norm
+    return expected[0] == actual[0]
 
-def partial_match_score(expected: str, actual: str, threshold: float = 0.8) -> bool:
+def partial_match_score(expected: Tuple[str, str], actual: Tuple[str, str], threshold: float = 0.8) -> bool:
     """Check if expected and actual answers have high similarity"""
-    expected_norm, expected_no_punct = normalize_text(expected)
-    actual_norm, actual_no_punct = normalize_text(actual)
+    expected_norm, expected_no_punct = expected
+    actual_norm, actual_no_punct = actual
     
     # Try different normalization levels
-    similarity1 = SequenceMatcher(None, expected_norm, actual_norm).ratio()
-    similarity2 = SequenceMatcher(None, expected_no_punct, actual_no_punct).ratio()
+    similarity1 = fuzz.ratio(expected_norm, actual_norm) / 100.0
+    similarity2 = fuzz.ratio(expected_no_punct, actual_no_punct) / 100.0
     
     return max(similarity1, similarity2) >= threshold
 
-def calculate_f1_score(expected: str, actual: str) -> float:
-    """Calculate F1 score between expected and actual answers"""
-    expected_norm, expected_no_punct = normalize_text(expected)
-    actual_norm, actual_no_punct = normalize_text(actual)
-    
-    # Split into words for token-level comparison
-    expected_words = set(expected_no_punct.split())
-    actual_words = set(actual_no_punct.split())
-    
+def calculate_f1_score(expected_words: set, actual_words: set) -> float:
+    """Calculate F1 score between the word sets of the expected and actual answers"""
     if not expected_words and not actual_words:
         return 1.0
     if not expected_words or not actual_words:
@@ -67,47 +91,52 @@ def calculate_f1_score(expected: str, actual: str) -> float:
     
     # Calculate precision and recall
     intersection = expected_words.intersection(actual_words)
-    precision = len(intersection) / len(actual_words) if actual_words else 0
-    recall = len(intersection) / len(expected_words) if expected_words else 0
+    precision = len(intersection) / len(actual_words)
+    recall = len(intersection) / len(expected_words)
     
     # Calculate F1 score
     if precision + recall == 0:
         return 0.0
     return 2 * (precision * recall) / (precision + recall)
 
-def evaluate_rag_system(evaluation_data: List[Dict], base_url: str = "http://localhost:8000") -> Dict:
+def calculate_f1_scores(expected_tokens: List[set], actual_tokens: List[set]) -> List[float]:
+    """Calculate F1 scores for many answers at once from pre-tokenized word sets"""
+    return [calculate_f1_score(e, a) for e, a in zip(expected_tokens, actual_tokens)]
+
+async def evaluate_rag_system(evaluation_data: List[Dict], base_url: str = "http://localhost:8000") -> Dict:
     """Evaluate the RAG system using the evaluation dataset"""
     
-    print("🚀 Starting RAG System Evaluation")
-    print(f"📊 Total questions to evaluate: {len(evaluation_data)}")
-    print(f"🌐 RAG System URL: {base_url}")
-    print("-" * 60)
+    logger.info("🚀 Starting RAG System Evaluation")
+    logger.info("📊 Total questions to evaluate: %d", len(evaluation_data))
+    logger.info("🌐 RAG System URL: %s", base_url)
+    logger.info("-" * 60)
     
     results = []
-    exact_matches = 0
-    partial_matches = 0
-    f1_scores = []
+    
+    # Query the RAG system for every question concurrently
+    answers = await query_all([item["question"] for item in evaluation_data], base_url)
+    
+    # Score all answers in a second, CPU-only pass: normalize and tokenize each answer once,
+    # then compute every metric over the whole list
+    expected_list = [item["expected_answer"] for item in evaluation_data]
+    expected_normalized = [normalize_text(e) for e in expected_list]
+    actual_normalized = [normalize_text(a) for a in answers]
+    expected_tokens = [set(e[1].split()) for e in expected_normalized]
+    actual_tokens = [set(a[1].split()) for a in actual_normalized]
+    
+    exact_match_flags = [exact_match_score(e, a) for e, a in zip(expected_normalized, actual_normalized)]
+    partial_match_flags = [partial_match_score(e, a) for e, a in zip(expected_normalized, actual_normalized)]
+    f1_scores = calculate_f1_scores(expected_tokens, actual_tokens)
+    
+    exact_matches = sum(exact_match_flags)
+    partial_matches = sum(partial_match_flags)
     
     for i, item in enumerate(evaluation_data):
         question = item["question"]
-        expected_answer = item["expected_answer"]
-        
-        print(f"🔍 Question {i+1}/{len(evaluation_data)}: {question}")
-        
-        # Query the RAG system
-        actual_answer = query_rag_system(question, base_url)
-        
-        # Calculate metrics
-        exact_match = exact_match_score(expected_answer, actual_answer)
-        partial_match = partial_match_score(expected_answer, actual_answer)
-        f1_score = calculate_f1_score(expected_answer, actual_answer)
-        
-        # Update counters
-        if exact_match:
-            exact_matches += 1
-        if partial_match:
-            partial_matches += 1
-        f1_scores.append(f1_score)
+        expected_answer = expected_list[i]
+        actual_answer = answers[i]
+        exact_match = exact_match_flags[i]
+        f1_score = f1_scores[i]
         
         # Store result
         result = {
@@ -115,20 +144,18 @@ def evaluate_rag_system(evaluation_data: List[Dict], base_url: str = "http://loc
             "expected": expected_answer,
             "actual": actual_answer,
             "exact_match": exact_match,
-            "partial_match": partial_match,
+            "partial_match": partial_match_flags[i],
             "f1_score": f1_score
         }
         results.append(result)
         
         # Print result
         status = "✅" if exact_match else "❌"
-        print(f"   {status} Expected: {expected_answer}")
-        print(f"   📝 Actual: {actual_answer}")
-        print(f"   📊 F1 Score: {f1_score:.3f}")
-        print()
-        
-        # Add small delay to avoid overwhelming the server
-        time.sleep(0.5)
+        logger.debug("🔍 Question %d/%d: %s", i + 1, len(evaluation_data), question)
+        logger.debug("   %s Expected: %s", status, expected_answer)
+        logger.debug("   📝 Actual: %s", actual_answer)
+        logger.debug("   📊 F1 Score: %.3f", f1_score)
+        logger.debug("")
     
     # Calculate overall metrics
     total_questions = len(evaluation_data)
@@ -137,16 +164,16 @@ def evaluate_rag_system(evaluation_data: List[Dict], base_url: str = "http://loc
     average_f1_score = sum(f1_scores) / len(f1_scores)
     
     # Print summary
-    print("=" * 60)
-    print("📈 EVALUATION RESULTS SUMMARY")
-    print("=" * 60)
-    print(f"📊 Total Questions: {total_questions}")
-    print(f"✅ Exact Matches: {exact_matches}")
-    print(f"🔍 Partial Matches: {partial_matches}")
-    print(f"📈 Exact Match Accuracy: {exact_match_accuracy:.3f} ({exact_match_accuracy*100:.1f}%)")
-    print(f"📈 Partial Match Accuracy: {partial_match_accuracy:.3f} ({partial_match_accuracy*100:.1f}%)")
-    print(f"📈 Average F1 Score: {average_f1_score:.3f}")
-    print("=" * 60)
+    logger.info("=" * 60)
+    logger.info("📈 EVALUATION RESULTS SUMMARY")
+    logger.info("=" * 60)
+    logger.info("📊 Total Questions: %d", total_questions)
+    logger.info("✅ Exact Matches: %d", exact_matches)
+    logger.info("🔍 Partial Matches: %d", partial_matches)
+    logger.info("📈 Exact Match Accuracy: %.3f (%.1f%%)", exact_match_accuracy, exact_match_accuracy * 100)
+    logger.info("📈 Partial Match Accuracy: %.3f (%.1f%%)", partial_match_accuracy, partial_match_accuracy * 100)
+    logger.info("📈 Average F1 Score: %.3f", average_f1_score)
+    logger.info("=" * 60)
     
     # Save detailed results
     detailed_results = {
@@ -164,7 +191,7 @@ def evaluate_rag_system(evaluation_data: List[Dict], base_url: str = "http://loc
     with open("evaluation_results.json", "w") as f:
         json.dump(detailed_results, f, indent=2)
     
-    print(f"📁 Detailed results saved to: evaluation_results.json")
+    logger.info("📁 Detailed results saved to: evaluation_results.json")
     
     return detailed_results
 
@@ -192,26 +219,29 @@ def analyze_results_by_question_type(results: List[Dict]) -> Dict:
         elif "film id" in question or "id" in question:
             question_types["title_by_id"].append(result)
     
-    print("\n📊 RESULTS BY QUESTION TYPE")
-    print("-" * 40)
+    logger.info("")
+    logger.info("📊 RESULTS BY QUESTION TYPE")
+    logger.info("-" * 40)
     
     for q_type, type_results in question_types.items():
         if type_results:
             exact_matches = sum(1 for r in type_results if r["exact_match"])
             avg_f1 = sum(r["f1_score"] for r in type_results) / len(type_results)
-            print(f"🔍 {q_type.replace('_', ' ').title()}:")
-            print(f"   Questions: {len(type_results)}")
-            print(f"   Exact Match: {exact_matches}/{len(type_results)} ({exact_matches/len(type_results)*100:.1f}%)")
-            print(f"   Avg F1 Score: {avg_f1:.3f}")
-            print()
+            logger.info("🔍 %s:", q_type.replace('_', ' ').title())
+            logger.info("   Questions: %d", len(type_results))
+            logger.info("   Exact Match: %d/%d (%.1f%%)", exact_matches, len(type_results), exact_matches / len(type_results) * 100)
+            logger.info("   Avg F1 Score: %.3f", avg_f1)
+            logger.info("")
 
 if __name__ == "__main__":
     # Load evaluation dataset
-    print("📂 Loading evaluation dataset...")
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+    
+    logger.info("📂 Loading evaluation dataset...")
     evaluation_data = load_evaluation_dataset()
     
     # Run evaluation
-    results = evaluate_rag_system(evaluation_data)
+    results = asyncio.run(evaluate_rag_system(evaluation_data))
     
     # Analyze by question type
     analyze_results_by_question_type(results["detailed_results"]) 
\ No newline at end of file
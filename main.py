@@ -1,9 +1,31 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from backend.backend import ask
+from backend.backend import ask, ask_stream, warm_up
 
-app = FastAPI(title="Film RAG API", description="AI-powered film search and recommendation system")
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The Chroma collection and OpenAI clients are created once when backend is imported and
+    # shared by every request; warming up here moves the index load off the first request
+    await asyncio.to_thread(warm_up)
+    yield
+
+app = FastAPI(
+    title="Film RAG API",
+    description="AI-powered film search and recommendation system",
+    lifespan=lifespan
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -19,17 +41,36 @@ class Question(BaseModel):
 
 @app.post("/ask")
 async def ask_question(question: Question):
+    if not question.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
     try:
-        if not question.question.strip():
-            raise HTTPException(status_code=400, detail="Question cannot be empty")
-        
         response = await ask(question.question)
-        return {
-            "answer": response["answer"],
-            "context": response["context"]
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    except Exception:
+        # Details go to the log, not to the client
+        logger.exception("❌ /ask failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    return {
+        "answer": response["answer"],
+        "context": response["context"]
+    }
+
+async def _sse(chunks):
+    """Frame each text chunk as a Server-Sent Event; newlines inside a chunk become extra data lines"""
+    async for chunk in chunks:
+        yield "".join(f"data: {line}\n" for line in chunk.split("\n")) + "\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(question: Question):
+    if not question.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    return StreamingResponse(
+        _sse(ask_stream(question.question)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 @app.get("/")
 async def root():
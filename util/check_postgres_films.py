@@ -4,58 +4,76 @@ Script to check PostgreSQL film table and get top 100 films ordered by film_id
 """
 
 import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+import sys
+from sqlalchemy import text
 
-# Load environment variables
-load_dotenv('config.env')
+# Make the shared helpers importable when run as `python3 util/check_postgres_films.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.db import get_engine
+
+# Rows per server-side cursor fetch, and per write to stdout
+FETCH_BATCH_SIZE = 500
 
 def check_postgres_films():
     print("🔍 Checking PostgreSQL Film Table")
     print("=" * 50)
     
     try:
-        # Connect to PostgreSQL
-        database_url = os.getenv("DATABASE_URL")
-        print(f"🔌 Connecting to: {database_url}")
-        
-        engine = create_engine(database_url)
-        conn = engine.connect()
-        
-        # Get total count
-        count_result = conn.execute(text("SELECT COUNT(*) FROM film")).fetchone()
-        total_films = count_result[0]
-        print(f"📊 Total films in database: {total_films}")
-        
-        # Get top 100 films ordered by film_id
-        print("\n🎬 Top 100 Films (ordered by film_id):")
-        print("-" * 80)
-        
-        result = conn.execute(text("""
-            SELECT film_id, title, description, release_year, rental_rate, rating
-            FROM film 
-            ORDER BY film_id 
-            LIMIT 100
-        """)).fetchall()
+        # Connect to PostgreSQL (creating the engine also loads config.env)
+        engine = get_engine()
+        print(f"🔌 Connecting to: {os.getenv('DATABASE_URL')}")
         
-        print(f"{'ID':<5} {'Title':<30} {'Year':<6} {'Rate':<6} {'Rating':<8} {'Description'}")
-        print("-" * 80)
-        
-        for row in result:
-            film_id = row.film_id
-            title = row.title[:28] + ".." if len(row.title) > 30 else row.title
-            year = row.release_year or "N/A"
-            rate = f"${row.rental_rate}" if row.rental_rate else "N/A"
-            rating = row.rating or "N/A"
-            description = row.description[:50] + "..." if row.description and len(row.description) > 50 else (row.description or "No description")
+        with engine.connect() as conn:
+            # Get total count
+            count_result = conn.execute(text("SELECT COUNT(*) FROM film")).fetchone()
+            total_films = count_result[0]
+            print(f"📊 Total films in database: {total_films}")
+            
+            # Get top 100 films ordered by film_id
+            print("\n🎬 Top 100 Films (ordered by film_id):")
+            print("-" * 80)
+            
+            print(f"{'ID':<5} {'Title':<30} {'Year':<6} {'Rate':<6} {'Rating':<8} {'Description'}")
+            print("-" * 80)
+            
+            # Stream rows through a server-side cursor so only one batch is held in memory
+            result = conn.execution_options(stream_results=True, yield_per=FETCH_BATCH_SIZE).execute(text("""
+                SELECT film_id, title, description, release_year, rental_rate, rating
+                FROM film
+                ORDER BY film_id
+                LIMIT 100
+            """))
             
-            print(f"{film_id:<5} {title:<30} {year:<6} {rate:<6} {rating:<8} {description}")
+            # Formatter hoisted out of the loop; rows are written one fetched batch at a time, so
+            # only a batch of lines is held in memory
+            fmt = "{:<5} {:<30} {:<6} {:<6} {:<8} {}".format
+            lines = []
+            row_count = 0
+            for row in result:
+                title = row.title if len(row.title) <= 30 else row.title[:28] + ".."
+                description = row.description or "No description"
+                if len(description) > 50:
+                    description = description[:50] + "..."
+                lines.append(fmt(
+                    row.film_id,
+                    title,
+                    row.release_year or "N/A",
+                    f"${row.rental_rate}" if row.rental_rate else "N/A",
+                    row.rating or "N/A",
+                    description
+                ))
+                if len(lines) == FETCH_BATCH_SIZE:
+                    sys.stdout.write("\n".join(lines) + "\n")
+                    row_count += len(lines)
+                    lines.clear()
+            if lines:
+                sys.stdout.write("\n".join(lines) + "\n")
+                row_count += len(lines)
         
-        print(f"\n✅ Retrieved {len(result)} films from PostgreSQL database")
+        print(f"\n✅ Retrieved {row_count} films from PostgreSQL database")
         
-        # Close connection
-        conn.close()
-        print("🔌 Database connection closed")
+        # Connection was returned to the pool when the with block exited
+        print("🔌 Database connection released")
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -66,4 +84,4 @@ def check_postgres_films():
         print("4. Ensure you have access to the database")
 
 if __name__ == "__main__":
-    check_postgres_films() 
\ No newline at end of file
+    check_postgres_films()
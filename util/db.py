@@ -0,0 +1,28 @@
+"""
+Shared SQLAlchemy engine for the util scripts
+"""
+
+import os
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+_engine = None
+
+
+def get_engine():
+    """Return the process-wide pooled engine, creating it on first use
+
+    Connections are checked out with `with engine.connect()` and returned to the pool instead
+    of being torn down after every query. Nothing is loaded or created at import time.
+    """
+    global _engine
+    if _engine is None:
+        # Load environment variables
+        load_dotenv('config.env')
+        _engine = create_engine(
+            os.getenv("DATABASE_URL"),
+            pool_size=20,
+            max_overflow=10,
+            pool_pre_ping=True
+        )
+    return _engine
@@ -4,103 +4,151 @@ Debug script to check ChromaDB collection status
 """
 
 import os
-from dotenv import load_dotenv
+import sys
+import asyncio
+import httpx
 import chromadb
-from sqlalchemy import create_engine, text
-from openai import OpenAI
-
-# Load environment variables
-load_dotenv('config.env')
-
-print("🔍 Debugging ChromaDB Collection")
-print("=" * 50)
+from dotenv import load_dotenv
+from sqlalchemy import text
+from openai import AsyncOpenAI
 
-# Initialize ChromaDB
-chroma_client = chromadb.Client()
-print(f"✅ ChromaDB client initialized")
+# Make the shared helpers importable when run as `python3 util/debug_chroma.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.db import get_engine
+from backend.embeddings import get_cached_embeddings, store_embeddings, normalize, dimensions_param
+from backend.vector_store import configure_hnsw_params
 
-# Check all collections
-collections = chroma_client.list_collections()
-print(f"📋 Available collections: {[col.name for col in collections]}")
+# Number of films used by the manual ingestion test
+TEST_FILM_COUNT = 10
+# Texts per embeddings request; the endpoint accepts up to 2048 inputs per call
+EMBED_BATCH_SIZE = 256
+# Items per collection.add call; each call updates the HNSW index once for the whole batch
+CHROMA_ADD_BATCH_SIZE = 1000
 
-# Get the films collection
-collection_name = os.getenv("CHROMA_COLLECTION_NAME", "films")
-print(f"🎯 Target collection name: {collection_name}")
+async def embed_all(aclient, texts, model):
+    """Embed texts with one request per batch, sending all batches concurrently"""
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    responses = await asyncio.gather(*[
+        aclient.embeddings.create(input=batch, model=model, dimensions=dimensions_param()) for batch in batches
+    ])
+    return [d.embedding for response in responses for d in response.data]
 
-try:
-    collection = chroma_client.get_collection(name=collection_name)
-    print(f"✅ Collection '{collection_name}' found")
+def main():
+    # Load environment variables; the database engine is created inside the checks that use it,
+    # so a missing DATABASE_URL is reported there instead of aborting the Chroma checks
+    load_dotenv('config.env')
     
-    # Check collection count
-    count = collection.count()
-    print(f"📊 Collection contains {count} documents")
+    print("🔍 Debugging ChromaDB Collection")
+    print("=" * 50)
     
-    if count > 0:
-        # Get a sample document
-        sample = collection.get(limit=1)
-        print(f"📄 Sample document ID: {sample['ids'][0]}")
-        print(f"📄 Sample document content: {sample['documents'][0][:100]}...")
-    else:
-        print("❌ Collection is empty!")
-        
-except Exception as e:
-    print(f"❌ Error accessing collection: {e}")
-
-print("\n🔍 Checking database connection...")
-try:
-    engine = create_engine(os.getenv("DATABASE_URL"))
-    conn = engine.connect()
+    # Open the same on-disk store as the API, so this inspects the real collection
+    chroma_client = chromadb.PersistentClient(path="./chroma_db")
+    print(f"✅ ChromaDB client initialized with persistent storage")
     
-    # Check if we can get film data
-    result = conn.execute(text("SELECT COUNT(*) FROM film")).fetchone()
-    print(f"📊 Database contains {result[0]} films")
+    # Check all collections
+    collections = chroma_client.list_collections()
+    print(f"📋 Available collections: {[col.name for col in collections]}")
     
-    # Get a sample film
-    sample_film = conn.execute(text("SELECT film_id, title, description FROM film LIMIT 1")).fetchone()
-    print(f"📄 Sample film: ID={sample_film.film_id}, Title='{sample_film.title}'")
+    # Get the films collection
+    collection_name = os.getenv("CHROMA_COLLECTION_NAME", "films")
+    print(f"🎯 Target collection name: {collection_name}")
     
-    conn.close()
-    
-except Exception as e:
-    print(f"❌ Database error: {e}")
-
-print("\n🔍 Manual data ingestion test...")
-try:
-    # Initialize OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    # Get a sample film for testing
-    engine = create_engine(os.getenv("DATABASE_URL"))
-    conn = engine.connect()
-    sample_film = conn.execute(text("SELECT film_id, title, description FROM film LIMIT 1")).fetchone()
-    conn.close()
-    
-    if sample_film:
-        text_to_embed = f"{sample_film.title}: {sample_film.description or ''}"
-        print(f"📝 Testing with: {text_to_embed[:100]}...")
+    try:
+        collection = chroma_client.get_collection(name=collection_name)
+        print(f"✅ Collection '{collection_name}' found")
         
-        # Get embedding
-        response = client.embeddings.create(
-            input=text_to_embed,
-            model=os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
-        )
-        embedding = response.data[0].embedding
-        print(f"✅ Embedding created (length: {len(embedding)})")
+        # Check collection count
+        count = collection.count()
+        print(f"📊 Collection contains {count} documents")
         
-        # Add to collection
-        collection = chroma_client.get_or_create_collection(collection_name)
-        collection.add(
-            documents=[text_to_embed],
-            embeddings=[embedding],
-            ids=[f"test_{sample_film.film_id}"]
+        if count > 0:
+            # Get a sample document
+            sample = collection.get(limit=1)
+            print(f"📄 Sample document ID: {sample['ids'][0]}")
+            print(f"📄 Sample document content: {sample['documents'][0][:100]}...")
+        else:
+            print("❌ Collection is empty!")
+            
+    except Exception as e:
+        print(f"❌ Error accessing collection: {e}")
+    
+    print("\n🔍 Checking database connection...")
+    try:
+        with get_engine().connect() as conn:
+            # Check if we can get film data
+            result = conn.execute(text("SELECT COUNT(*) FROM film")).fetchone()
+            print(f"📊 Database contains {result[0]} films")
+            
+            # Get a sample film
+            sample_film = conn.execute(text("SELECT film_id, title, description FROM film LIMIT 1")).fetchone()
+            print(f"📄 Sample film: ID={sample_film.film_id}, Title='{sample_film.title}'")
+        
+    except Exception as e:
+        print(f"❌ Database error: {e}")
+    
+    print("\n🔍 Manual data ingestion test...")
+    try:
+        # Initialize OpenAI; concurrent batches are multiplexed over one HTTP/2 keep-alive connection
+        aclient = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(http2=True, timeout=30.0)
         )
-        print(f"✅ Test document added to collection")
+        embed_model = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
         
-        # Check count again
-        new_count = collection.count()
-        print(f"📊 Collection now contains {new_count} documents")
+        # Get a batch of sample films for testing
+        with get_engine().connect() as conn:
+            sample_films = conn.execute(
+                text("SELECT film_id, title, description FROM film ORDER BY film_id LIMIT :batch"),
+                {"batch": TEST_FILM_COUNT}
+            ).fetchall()
         
-except Exception as e:
-    print(f"❌ Manual ingestion error: {e}")
+        if sample_films:
+            texts = [f"{r.title}: {r.description or ''}" for r in sample_films]
+            ids = [f"test_{r.film_id}" for r in sample_films]
+            print(f"📝 Testing with {len(texts)} films, e.g. {texts[0][:100]}...")
+            
+            # Reuse embeddings precomputed by earlier runs; only the misses go to OpenAI, with one
+            # request per batch and all batches in flight together
+            embeddings = get_cached_embeddings(texts, embed_model)
+            missing = [i for i, e in enumerate(embeddings) if e is None]
+            print(f"♻️  {len(texts) - len(missing)} embeddings found in cache, {len(missing)} to fetch")
+            if missing:
+                new_texts = [texts[i] for i in missing]
+                new_embeddings = [normalize(e) for e in asyncio.run(embed_all(aclient, new_texts, embed_model))]
+                store_embeddings(new_texts, new_embeddings, embed_model)
+                for i, embedding in zip(missing, new_embeddings):
+                    embeddings[i] = embedding
+            print(f"✅ {len(embeddings)} embeddings ready (length: {len(embeddings[0])})")
+            
+            # Add to a scratch collection, created with the same HNSW settings as ingest.py, so
+            # test documents never end up in the persisted films collection
+            test_collection_name = f"{collection_name}_debug"
+            collection = chroma_client.get_or_create_collection(
+                test_collection_name,
+                metadata=configure_hnsw_params(len(texts)),
+                # Test documents are added with the embeddings computed above
+                embedding_function=None
+            )
+            for start in range(0, len(ids), CHROMA_ADD_BATCH_SIZE):
+                end = start + CHROMA_ADD_BATCH_SIZE
+                collection.add(
+                    documents=texts[start:end],
+                    embeddings=embeddings[start:end],
+                    ids=ids[start:end]
+                )
+            print(f"✅ {len(ids)} test documents added to collection")
+            
+            # Check count again
+            new_count = collection.count()
+            print(f"📊 Collection now contains {new_count} documents")
+            
+            chroma_client.delete_collection(test_collection_name)
+            print(f"🧹 Test collection '{test_collection_name}' removed")
+            
+    except Exception as e:
+        print(f"❌ Manual ingestion error: {e}")
+    
+    print("\n✅ Debug complete!")
 
-print("\n✅ Debug complete!") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()